@@ -1,16 +1,22 @@
 # API/auth.py
 
 import os
+import time
+import logging
 import secrets
 import hashlib
+import threading
 from datetime import datetime, timedelta
 from typing import Dict
 
+from cachetools import TTLCache
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 
+logger = logging.getLogger("api.auth")
+
 # =========================
 # Configurações JWT
 # =========================
@@ -18,25 +24,41 @@ from passlib.context import CryptContext
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 8
 
-# Não derruba a aplicação no import
+# Não derruba a aplicação no import (a validação acontece no startup)
 JWT_SECRET = os.getenv("JWT_SECRET", "")
 
+# Ambiente de execução; em produção a ausência do JWT_SECRET impede o startup
+ENV = os.getenv("ENV", "").lower()
+
 # Pepper para hash de token (Camada extra de segurança)
 RESET_TOKEN_PEPPER = os.getenv("RESET_TOKEN_PEPPER", "")
+_RESET_TOKEN_PEPPER_BYTES = RESET_TOKEN_PEPPER.encode()
 
 # =========================
 # Segurança
 # =========================
 
-# ATENÇÃO: Requer passlib==1.7.4 e bcrypt==3.2.2 para evitar 
+# Custo do bcrypt (log2 das rodadas). Cada +1 dobra o tempo de hash/verify.
+# Padrão 12 (mínimo recomendado); reduzir via env só se o hardware exigir.
+# Hashes antigos (gerados com outro custo) continuam sendo verificados normalmente.
+BCRYPT_COST = min(max(int(os.getenv("BCRYPT_COST", "12")), 8), 14)
+
+# ATENÇÃO: Requer passlib==1.7.4 e bcrypt==3.2.2 para evitar
 # erro "AttributeError: module 'bcrypt' has no attribute '__about__'"
 pwd_context = CryptContext(
     schemes=["bcrypt"],
+    bcrypt__rounds=BCRYPT_COST,
     deprecated="auto"
 )
 
 bearer_scheme = HTTPBearer(auto_error=True)
 
+# Cache de payloads JWT já validados (chave = SHA-256 do token, nunca o token cru).
+# Evita refazer HMAC + base64 + JSON a cada request do mesmo token.
+# TTLCache não é thread-safe e get_current_user roda no threadpool: todo acesso passa pelo lock.
+_token_cache: TTLCache = TTLCache(maxsize=10000, ttl=30)
+_token_cache_lock = threading.Lock()
+
 # =========================
 # Utilitários
 # =========================
@@ -53,25 +75,53 @@ def _get_jwt_secret() -> str:
         )
     return JWT_SECRET
 
+def validar_jwt_secret() -> None:
+    """
+    Valida o JWT_SECRET uma única vez no startup.
+    Em produção (ENV=prod/production) falha o boot; em dev apenas avisa,
+    e as rotas que usam JWT respondem 500 via _get_jwt_secret().
+    """
+    if JWT_SECRET:
+        return
+    if ENV in ("prod", "production"):
+        raise RuntimeError("JWT_SECRET não configurado no ambiente")
+    logger.warning("JWT_SECRET não configurado. Rotas autenticadas por JWT vão falhar.")
+
 # =========================
 # Hash de senha
 # =========================
 
+def _senha_bytes(senha: str) -> bytes:
+    """
+    O bcrypt só considera os primeiros 72 bytes da senha.
+    Cortamos direto nos bytes UTF-8 (o mesmo segredo efetivo do corte anterior
+    por caracteres), evitando uma cópia extra da string e a recodificação no passlib.
+    """
+    return senha.encode("utf-8")[:72]
+
 def hash_senha(senha: str) -> str:
     """
     Gera hash bcrypt da senha.
-    O passlib espera string, não bytes. Truncamos a string em 72 caracteres
-    para evitar erros do algoritmo bcrypt com senhas longas.
     """
-    senha_truncada = senha[:72]
-    return pwd_context.hash(senha_truncada)
+    return pwd_context.hash(_senha_bytes(senha))
 
 def verificar_senha(senha: str, senha_hash: str) -> bool:
     """
     Verifica se a senha confere com o hash.
     """
-    senha_truncada = senha[:72]
-    return pwd_context.verify(senha_truncada, senha_hash)
+    return pwd_context.verify(_senha_bytes(senha), senha_hash)
+
+# Hash de uma senha aleatória, gerado no import (uma vez por processo). Se fosse
+# preguiçoso, o primeiro login com e-mail inexistente pagaria hash + verify, o
+# dobro de um login normal: justamente o sinal de tempo que queremos esconder.
+_HASH_DUMMY = hash_senha(secrets.token_urlsafe(16))
+
+def simular_verificacao_senha(senha: str) -> None:
+    """
+    Faz um verify bcrypt descartável quando o usuário não existe, para que
+    o tempo de resposta não revele quais e-mails estão cadastrados.
+    """
+    verificar_senha(senha, _HASH_DUMMY)
 
 # =========================
 # Token de Recuperação (Secure)
@@ -88,9 +138,9 @@ def hash_token(token: str) -> str:
     Gera o hash SHA-256 do token + PEPPER para armazenamento seguro no banco.
     O pepper impede que ataques de rainbow table funcionem facilmente caso o banco vaze.
     """
-    # Concatena o pepper ao token antes de hashar
-    dados = token + RESET_TOKEN_PEPPER
-    return hashlib.sha256(dados.encode()).hexdigest()
+    # Concatena o pepper (já em bytes) ao token antes de hashar.
+    # hashlib.sha256 usa a implementação do OpenSSL (SHA-NI quando disponível).
+    return hashlib.sha256(token.encode() + _RESET_TOKEN_PEPPER_BYTES).hexdigest()
 
 # =========================
 # JWT
@@ -100,7 +150,8 @@ def criar_token(dados: Dict) -> str:
     """
     Cria token JWT com expiração.
     """
-    secret = _get_jwt_secret()
+    # Caminho quente: com o segredo configurado não há chamada extra
+    secret = JWT_SECRET or _get_jwt_secret()
 
     payload = dados.copy()
     # Usando UTC Naive para compatibilidade com sistema legado/drivers simples
@@ -115,13 +166,24 @@ def get_current_user(
     """
     Dependency do FastAPI para recuperar usuário a partir do JWT.
     """
-    secret = _get_jwt_secret()
+    # Caminho quente: com o segredo configurado não há chamada extra
+    secret = JWT_SECRET or _get_jwt_secret()
     token = credentials.credentials
+    chave = hashlib.sha256(token.encode()).digest()
+
+    with _token_cache_lock:
+        payload = _token_cache.get(chave)
+    if payload is not None and payload.get("exp", 0) > time.time():
+        return payload
 
     try:
         payload = jwt.decode(token, secret, algorithms=[ALGORITHM])
+        with _token_cache_lock:
+            _token_cache[chave] = payload
         return payload
     except JWTError:
+        with _token_cache_lock:
+            _token_cache.pop(chave, None)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido ou expirado"
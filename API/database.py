@@ -23,12 +23,28 @@ if not DATABASE_URL:
 # Engine
 # =========================
 
+# Tamanho do pool por worker. pool_size conexões ficam abertas; em rajadas
+# até DB_MAX_OVERFLOW extras são abertas e fechadas ao devolver.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+# pool_pre_ping descarta conexões mortas antes do uso;
+# pool_recycle renova conexões antes do timeout de ociosidade do Azure SQL (~30 min).
+# pool_timeout curto: com o pool esgotado, falha rápido em vez de segurar o request.
+# query_cache_size maior mantém mais SQL compilado em cache (padrão: 500).
+# fast_executemany (só pyodbc) manda executemany em lote num único round-trip TDS.
+_opcoes_driver = {"fast_executemany": True} if DATABASE_URL.startswith("mssql+pyodbc") else {}
+
 engine: Engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
-    future=True
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=10,
+    pool_recycle=1800,
+    query_cache_size=1200,
+    future=True,
+    **_opcoes_driver
 )
 
 # =========================
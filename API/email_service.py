@@ -2,6 +2,11 @@
 
 import os
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from string import Template
+from typing import Optional
+
 from azure.communication.email import EmailClient
 
 logger = logging.getLogger("api.email")
@@ -26,21 +31,114 @@ BASE_API_URL = os.getenv("BASE_API_URL", "http://127.0.0.1:8000")
 # URL do Frontend de Login para links de recuperação
 FRONTEND_LOGIN_URL = os.getenv("FRONTEND_LOGIN_URL", "http://127.0.0.1:5500/index.html")
 
-def enviar_email_verificacao(destinatario: str, token: str) -> bool:
+# =========================
+# Cliente ACS (singleton)
+# =========================
+
+# O EmailClient é thread-safe e mantém o pool de conexões HTTPS.
+# Criamos uma única instância por processo em vez de uma por envio.
+_email_client: Optional[EmailClient] = None
+_email_client_lock = threading.Lock()
+
+def _get_email_client() -> EmailClient:
+    """
+    Retorna o EmailClient compartilhado, criando-o no primeiro uso.
+    """
+    global _email_client
+    if _email_client is None:
+        with _email_client_lock:
+            if _email_client is None:
+                _email_client = EmailClient.from_connection_string(AZURE_ACS_CONNECTION_STRING)
+    return _email_client
+
+# Acompanha a conclusão dos envios sem segurar a resposta HTTP
+_envio_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="email")
+
+def _aguardar_envio(poller, tipo: str) -> None:
+    """
+    Aguarda o resultado do envio no ACS e registra o MessageId (ou a falha).
+    """
+    try:
+        result = poller.result()
+
+        msg_id = getattr(result, 'message_id', None)
+        if not msg_id and isinstance(result, dict):
+            msg_id = result.get('messageId')
+
+        logger.info(f"E-mail {tipo} enviado! MessageId: {msg_id or 'desconhecido'}")
+    except Exception as e:
+        logger.error(f"ERRO CRÍTICO ao concluir envio do e-mail de {tipo} via ACS: {e}")
+
+# =========================
+# Templates de E-mail
+# =========================
+
+# Montados uma única vez no import; a cada envio só substituímos o ${link}.
+_VERIF_TEXT_TPL = Template("Bem-vindo à Atimus! Clique no link para verificar seu e-mail: ${link}")
+
+_VERIF_HTML_TPL = Template("""
+<html>
+    <body style="font-family: Arial, sans-serif; color: #333;">
+        <div style="background-color: #f8fafc; padding: 20px; border-radius: 8px;">
+            <h1 style="color: #1e293b;">Bem-vindo à Atimus</h1>
+            <p>Obrigado por se cadastrar. Para ativar sua conta e acessar os editais, clique no botão abaixo:</p>
+            <p style="margin: 30px 0;">
+                <a href="${link}" style="background-color: #2563eb; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
+                    Verificar Meu E-mail
+                </a>
+            </p>
+            <p style="font-size: 12px; color: #64748b;">
+                Ou cole este link no seu navegador: <br>
+                ${link}
+            </p>
+        </div>
+    </body>
+</html>
+""")
+
+_RECOV_TEXT_TPL = Template("Recebemos um pedido para redefinir sua senha. Clique aqui: ${link}")
+
+_RECOV_HTML_TPL = Template("""
+<html>
+    <body style="font-family: Arial, sans-serif; color: #333;">
+        <div style="background-color: #f8fafc; padding: 20px; border-radius: 8px;">
+            <h2 style="color: #1e293b;">Redefinição de Senha</h2>
+            <p>Você solicitou a recuperação de sua senha na Atimus. Clique no botão abaixo para criar uma nova senha:</p>
+            <p style="margin: 30px 0;">
+                <a href="${link}" style="background-color: #ef4444; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
+                    Redefinir Minha Senha
+                </a>
+            </p>
+            <p style="font-size: 14px;">Se você não solicitou isso, apenas ignore este e-mail.</p>
+            <p style="font-size: 12px; color: #64748b;">
+                Link direto: <br>
+                ${link}
+            </p>
+        </div>
+    </body>
+</html>
+""")
+
+def enviar_email_verificacao(destinatario: str, token: str, uid: Optional[int] = None) -> bool:
     """
     Envia o e-mail de verificação usando Azure Communication Services.
-    Retorna True se enviado, False se as chaves não estiverem configuradas ou houver erro.
+    Com `uid`, o link leva o id do cliente para a API buscar a linha por ele
+    e comparar o token em tempo constante.
+    Retorna True se a mensagem foi submetida, False se as chaves não estiverem
+    configuradas ou houver erro na submissão.
     """
     if not AZURE_ACS_CONNECTION_STRING or not SENDER_EMAIL:
         logger.warning("AZURE_ACS_CONNECTION_STRING ou SENDER_EMAIL não configurados. E-mail real ignorado.")
         return False
 
     try:
-        client = EmailClient.from_connection_string(AZURE_ACS_CONNECTION_STRING)
+        client = _get_email_client()
         
         # Garante que a URL não termine com barra para evitar // no link
         base_url = BASE_API_URL.rstrip('/')
         link_verificacao = f"{base_url}/cliente/verificar-email?token={token}"
+        if uid is not None:
+            link_verificacao += f"&uid={uid}"
         
         logger.info(f"Iniciando envio de e-mail de verificação para {destinatario} via ACS...")
 
@@ -51,37 +149,15 @@ def enviar_email_verificacao(destinatario: str, token: str) -> bool:
             },
             "content": {
                 "subject": "Verificação de Email - Atimus",
-                "plainText": f"Bem-vindo à Atimus! Clique no link para verificar seu e-mail: {link_verificacao}",
-                "html": f"""
-                <html>
-                    <body style="font-family: Arial, sans-serif; color: #333;">
-                        <div style="background-color: #f8fafc; padding: 20px; border-radius: 8px;">
-                            <h1 style="color: #1e293b;">Bem-vindo à Atimus</h1>
-                            <p>Obrigado por se cadastrar. Para ativar sua conta e acessar os editais, clique no botão abaixo:</p>
-                            <p style="margin: 30px 0;">
-                                <a href="{link_verificacao}" style="background-color: #2563eb; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                                    Verificar Meu E-mail
-                                </a>
-                            </p>
-                            <p style="font-size: 12px; color: #64748b;">
-                                Ou cole este link no seu navegador: <br>
-                                {link_verificacao}
-                            </p>
-                        </div>
-                    </body>
-                </html>
-                """
+                "plainText": _VERIF_TEXT_TPL.substitute(link=link_verificacao),
+                "html": _VERIF_HTML_TPL.substitute(link=link_verificacao)
             }
         }
 
+        # begin_send já submete a mensagem; a confirmação (poller.result) pode levar
+        # segundos e é aguardada em background, fora do request.
         poller = client.begin_send(message)
-        result = poller.result()
-        
-        msg_id = getattr(result, 'message_id', None)
-        if not msg_id and isinstance(result, dict):
-            msg_id = result.get('messageId')
-        
-        logger.info(f"E-mail verificação enviado! MessageId: {msg_id or 'desconhecido'}")
+        _envio_pool.submit(_aguardar_envio, poller, "verificação")
         return True
 
     except Exception as e:
@@ -89,7 +165,7 @@ def enviar_email_verificacao(destinatario: str, token: str) -> bool:
         return False
 
 
-def enviar_email_recuperacao(destinatario: str, token: str) -> bool:
+def enviar_email_recuperacao(destinatario: str, token: str, uid: Optional[int] = None) -> bool:
     """
     Envia e-mail com link para redefinição de senha.
     """
@@ -98,7 +174,7 @@ def enviar_email_recuperacao(destinatario: str, token: str) -> bool:
         return False
 
     try:
-        client = EmailClient.from_connection_string(AZURE_ACS_CONNECTION_STRING)
+        client = _get_email_client()
         
         # Monta link apontando para o FRONTEND, não para a API
         # Ex: https://login.atimus.agr.br/?reset_token=XYZ
@@ -106,6 +182,8 @@ def enviar_email_recuperacao(destinatario: str, token: str) -> bool:
             link_recuperacao = f"{FRONTEND_LOGIN_URL}&reset_token={token}"
         else:
             link_recuperacao = f"{FRONTEND_LOGIN_URL}?reset_token={token}"
+        if uid is not None:
+            link_recuperacao += f"&uid={uid}"
         
         logger.info(f"Iniciando envio de e-mail de recuperação para {destinatario}...")
 
@@ -116,38 +194,15 @@ def enviar_email_recuperacao(destinatario: str, token: str) -> bool:
             },
             "content": {
                 "subject": "Recuperação de Senha - Atimus",
-                "plainText": f"Recebemos um pedido para redefinir sua senha. Clique aqui: {link_recuperacao}",
-                "html": f"""
-                <html>
-                    <body style="font-family: Arial, sans-serif; color: #333;">
-                        <div style="background-color: #f8fafc; padding: 20px; border-radius: 8px;">
-                            <h2 style="color: #1e293b;">Redefinição de Senha</h2>
-                            <p>Você solicitou a recuperação de sua senha na Atimus. Clique no botão abaixo para criar uma nova senha:</p>
-                            <p style="margin: 30px 0;">
-                                <a href="{link_recuperacao}" style="background-color: #ef4444; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                                    Redefinir Minha Senha
-                                </a>
-                            </p>
-                            <p style="font-size: 14px;">Se você não solicitou isso, apenas ignore este e-mail.</p>
-                            <p style="font-size: 12px; color: #64748b;">
-                                Link direto: <br>
-                                {link_recuperacao}
-                            </p>
-                        </div>
-                    </body>
-                </html>
-                """
+                "plainText": _RECOV_TEXT_TPL.substitute(link=link_recuperacao),
+                "html": _RECOV_HTML_TPL.substitute(link=link_recuperacao)
             }
         }
 
+        # begin_send já submete a mensagem; a confirmação (poller.result) pode levar
+        # segundos e é aguardada em background, fora do request.
         poller = client.begin_send(message)
-        result = poller.result()
-        
-        msg_id = getattr(result, 'message_id', None)
-        if not msg_id and isinstance(result, dict):
-            msg_id = result.get('messageId')
-        
-        logger.info(f"E-mail recuperação enviado! MessageId: {msg_id or 'desconhecido'}")
+        _envio_pool.submit(_aguardar_envio, poller, "recuperação")
         return True
 
     except Exception as e:
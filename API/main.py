@@ -1,30 +1,43 @@
 import os
-import json
-import io
+import re
+import hashlib
+import hmac
+import random
+import secrets
+import asyncio
 import logging
-import uuid
-from datetime import datetime, timedelta
-
-import requests
-from fastapi import FastAPI, Depends, HTTPException, Body, Request, status, Cookie, Response
-from fastapi.responses import JSONResponse, RedirectResponse
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+
+import anyio
+import httpx
+import orjson
+from cachetools import TTLCache
+from fastapi import FastAPI, Depends, HTTPException, Body, Query, Request, status, Cookie, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, RedirectResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, text, inspect
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy import Select, or_, text, func, literal_column, select, insert, update, type_coerce, UnicodeText, bindparam
 from sqlalchemy.exc import OperationalError, IntegrityError
 from pydantic import BaseModel, Field
-from openai import AzureOpenAI
-from PyPDF2 import PdfReader
 
 from .database import engine, get_db
-from .models import Base, Edital, User, Cliente
-from .auth import verificar_senha, hash_senha, criar_token, get_current_user, gerar_reset_token, hash_token
-from .email_service import enviar_email_verificacao, enviar_email_recuperacao
+from .models import Edital, User, Cliente, texto_para_busca
+from .auth import verificar_senha, simular_verificacao_senha, hash_senha, criar_token, get_current_user, gerar_reset_token, hash_token, validar_jwt_secret
+from .email_service import BASE_API_URL, enviar_email_verificacao, enviar_email_recuperacao
+from .pdf_service import MAX_TEXTO_EDITAL, IndiceTrechos, extrair_texto_pdf, indexar_trechos, selecionar_trechos
+from .migrations import aplicar_migracoes
+from .rate_limit import rate_limit
 
 # =========================
 # App Initialization
 # =========================
-app = FastAPI(title="API de Editais + Chatbot")
+app = FastAPI(title="API de Editais + Chatbot", default_response_class=ORJSONResponse)
 
 # =========================
 # Logging
@@ -55,10 +68,18 @@ app.add_middleware(
         "http://127.0.0.1:8000"
     ],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Lista fechada (métodos/headers realmente usados pelos frontends): o preflight
+    # compara contra um conjunto fixo em vez de ecoar o que o navegador pedir
+    allow_methods=["GET", "POST", "PUT", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
+# =========================
+# Compressão
+# =========================
+# Respostas grandes (ex: /editais) saem comprimidas; payloads pequenos não compensam
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # =========================
 # Azure OpenAI Config
 # =========================
@@ -67,61 +88,75 @@ AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT")
 API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-12-01-preview")
 
-client: AzureOpenAI | None = None
-if AZURE_API_KEY and AZURE_ENDPOINT and DEPLOYMENT_NAME:
-    client = AzureOpenAI(
+OPENAI_CONFIGURADO = bool(AZURE_API_KEY and AZURE_ENDPOINT and DEPLOYMENT_NAME)
+if not OPENAI_CONFIGURADO:
+    logger.warning("Azure OpenAI NÃO configurado.")
+
+@lru_cache(maxsize=1)
+def get_openai_client():
+    """
+    Cria o cliente Azure OpenAI no primeiro uso do chat (uma vez por worker).
+    Workers que nunca atendem /chat/edital não abrem o pool TLS
+    nem pagam o import do SDK no boot.
+    """
+    if not OPENAI_CONFIGURADO:
+        return None
+    from openai import AzureOpenAI
+    return AzureOpenAI(
         api_key=AZURE_API_KEY,
         api_version=API_VERSION,
         azure_endpoint=AZURE_ENDPOINT
     )
-    logger.info("Azure OpenAI configurado com sucesso.")
-else:
-    logger.warning("Azure OpenAI NÃO configurado.")
 
 # =========================
 # Startup & Auto-Migration
 # =========================
+# Padrão ligado: o deploy (Azure App Service) não roda scripts/create_tables.py,
+# então cada worker verifica o schema no startup. As migrações rodam sob um lock
+# de banco (ver migrations.lock_migracoes): um worker aplica, os demais esperam e
+# só confirmam. Com o script rodando no deploy, AUTO_MIGRATE=0 pula essa etapa.
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1").lower() not in ("0", "false", "no")
+
 @app.on_event("startup")
 def startup():
+    validar_jwt_secret()
+
+    if not AUTO_MIGRATE:
+        return
     try:
-        # 1. Garante que tabelas existam
-        Base.metadata.create_all(bind=engine)
-        logger.info("Banco de dados: Estrutura base verificada.")
-        
-        # 2. AUTO-MIGRATION: Adiciona colunas novas se faltarem
-        inspector = inspect(engine)
-        if inspector.has_table("clientes"):
-            columns = [c["name"] for c in inspector.get_columns("clientes")]
-            
-            with engine.connect() as conn:
-                # Reset Token Hash
-                if "reset_token_hash" not in columns:
-                    logger.info("MIGRATION: Adicionando coluna 'reset_token_hash'...")
-                    conn.execute(text("ALTER TABLE clientes ADD reset_token_hash VARCHAR(255) NULL"))
-                    conn.commit()
-                
-                # Reset Token Expiration
-                if "reset_token_expiration" not in columns:
-                    logger.info("MIGRATION: Adicionando coluna 'reset_token_expiration'...")
-                    conn.execute(text("ALTER TABLE clientes ADD reset_token_expiration DATETIME NULL"))
-                    conn.commit()
-                
-                # Token (Session)
-                if "token" not in columns:
-                    logger.info("MIGRATION: Adicionando coluna 'token'...")
-                    conn.execute(text("ALTER TABLE clientes ADD token VARCHAR(255) NULL"))
-                    conn.commit()
-
-                # Token Expiration (Session)
-                if "token_expiration" not in columns:
-                    logger.info("MIGRATION: Adicionando coluna 'token_expiration'...")
-                    conn.execute(text("ALTER TABLE clientes ADD token_expiration DATETIME NULL"))
-                    conn.commit()
-
-        logger.info("Banco de dados: Migrações verificadas.")
+        aplicar_migracoes(engine)
     except Exception as e:
         logger.error(f"Erro crítico ao iniciar banco: {e}")
 
+# Tamanho do threadpool onde o Starlette executa as rotas `def`.
+# O hash/verify de senha (bcrypt) ocupa uma thread por ~100ms; com folga,
+# logins simultâneos não deixam sem thread as rotas que só dependem do banco.
+THREADPOOL_TOKENS = int(os.getenv("THREADPOOL_TOKENS", "64"))
+
+@app.on_event("startup")
+async def startup_workers():
+    global http_client, pdf_pool
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
+    # forkserver: os filhos não nascem de um fork do worker, que já tem threads
+    # (threadpool, pool de e-mail, pool do SQLAlchemy) e poderia herdar locks presos
+    pdf_pool = ProcessPoolExecutor(
+        max_workers=PDF_POOL_WORKERS,
+        mp_context=multiprocessing.get_context("forkserver")
+    )
+    http_client = httpx.AsyncClient(
+        http2=True,
+        timeout=10.0,
+        follow_redirects=True,
+        limits=httpx.Limits(max_keepalive_connections=20)
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    if http_client:
+        await http_client.aclose()
+    if pdf_pool:
+        pdf_pool.shutdown(wait=False, cancel_futures=True)
+
 # =========================
 # Models (Pydantic)
 # =========================
@@ -150,6 +185,8 @@ class EsqueciSenhaRequest(BaseModel):
 
 class RedefinirSenhaRequest(BaseModel):
     token: str
+    # id do cliente vindo do link (?uid=); opcional para links emitidos antes dele
+    uid: int | None = None
     nova_senha: str = Field(..., min_length=6, max_length=64)
 
 class AdminSetup(BaseModel):
@@ -164,10 +201,86 @@ def parse_date(date_str):
     if not date_str:
         return None
     try:
-        return datetime.strptime(str(date_str).split("T")[0], "%Y-%m-%d").date()
+        # fromisoformat é implementado em C; o prefixo YYYY-MM-DD descarta hora/fuso
+        return date.fromisoformat(str(date_str)[:10])
     except ValueError:
         return None
 
+@lru_cache(maxsize=1)
+def fulltext_mssql_disponivel() -> bool:
+    """
+    Verifica uma vez por worker se 'editais' tem índice full-text com texto_busca
+    no SQL Server (criado pelas migrações quando a instância suporta Full-Text Search).
+    """
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT 1 FROM sys.fulltext_index_columns fic "
+                "JOIN sys.columns c ON c.object_id = fic.object_id AND c.column_id = fic.column_id "
+                "WHERE fic.object_id = OBJECT_ID('editais') AND c.name = 'texto_busca'"
+            )).first() is not None
+    except Exception as e:
+        logger.warning(f"Full-text indisponível, /chat usa LIKE: {e}")
+        return False
+
+# Statements da busca do /chat, montados uma vez e executados só trocando parâmetros.
+# Full-text (PostgreSQL / SQL Server): um único parâmetro com todos os termos.
+_search_vec = literal_column("editais.search_vec")
+_tsquery = func.websearch_to_tsquery("portuguese", bindparam("busca"))
+_Q_CHAT_TSVECTOR = (
+    select(Edital.id, Edital.titulo)
+    .where(_search_vec.op("@@")(_tsquery))
+    .order_by(func.ts_rank(_search_vec, _tsquery).desc())
+    .limit(5)
+)
+_Q_CHAT_CONTAINS = (
+    select(Edital.id, Edital.titulo)
+    .where(text("CONTAINS((editais.titulo, editais.texto_busca), :busca)"))
+    .limit(5)
+)
+
+# ILIKE: um statement por quantidade de termos ({n: Select}), com parâmetros t0..tn-1.
+# Limitar os termos mantém o cache pequeno (e a consulta razoável).
+# Busca no texto_busca; editais ainda não preenchidos caem no json_data cru.
+_texto_busca_chat = func.coalesce(Edital.texto_busca, type_coerce(Edital.json_data, UnicodeText))
+MAX_TERMOS_CHAT = 8
+_chat_stmt_cache: dict[int, Select] = {}
+
+def _stmt_chat_like(n: int) -> Select:
+    stmt = _chat_stmt_cache.get(n)
+    if stmt is None:
+        filtros = [
+            or_(Edital.titulo.ilike(bindparam(f"t{i}")), _texto_busca_chat.ilike(bindparam(f"t{i}")))
+            for i in range(n)
+        ]
+        stmt = select(Edital.id, Edital.titulo).where(or_(*filtros)).limit(5)
+        _chat_stmt_cache[n] = stmt
+    return stmt
+
+def buscar_editais_chat(db: Session, termos: list[str]):
+    """
+    Executa a busca do /chat (até 5 editais).
+    No PostgreSQL usa a coluna tsvector indexada (uma única sondagem no GIN),
+    ordenando por relevância; no SQL Server com índice full-text usa CONTAINS;
+    nos demais casos mantém o ILIKE por termo (sem as siglas curtas).
+    """
+    termos = list(dict.fromkeys(termos))[:MAX_TERMOS_CHAT]
+    if engine.dialect.name == "postgresql":
+        # websearch_to_tsquery aceita texto livre do usuário sem erro de sintaxe
+        return db.execute(_Q_CHAT_TSVECTOR, {"busca": " or ".join(termos)}).all()
+    if engine.dialect.name == "mssql" and fulltext_mssql_disponivel():
+        # Termos vêm do regex \w{3,}: sem aspas/operadores, seguros dentro de "...".
+        # Prefixo ("termo*") para casar como o LIKE casava: "inova" acha "inovação"
+        busca = " OR ".join(f'"{t}*"' for t in termos)
+        return db.execute(_Q_CHAT_CONTAINS, {"busca": busca}).all()
+    # ILIKE casa substring: siglas curtas ("ia" → '%ia%') achariam "dia", "via",
+    # "tecnologia"... Aqui ficam só os termos de 3+ letras; as siglas valem no full-text.
+    termos = [t for t in termos if len(t) >= 3]
+    if not termos:
+        return []
+    params = {f"t{i}": f"%{t}%" for i, t in enumerate(termos)}
+    return db.execute(_stmt_chat_like(len(termos)), params).all()
+
 def mask_email(email: str) -> str:
     if not email or "@" not in email:
         return "***"
@@ -191,29 +304,208 @@ def force_naive_utc(dt: datetime) -> datetime:
         return dt.replace(tzinfo=None)
     return dt
 
-def simular_envio_email(email: str, token: str, tipo: str = "verificacao"):
+# =========================
+# Cache de Sessão (cliente)
+# =========================
+# Sessões validadas no banco: {sha256(cookie): (id, nome, token_expiration)}.
+# A chave é o hash, nunca o token cru (o mesmo valor gravado em Cliente.token_hash). TTL curto: uma revogação (ex: redefinir senha)
+# feita em outro worker vale aqui em no máximo 30s; a expiração é checada a cada hit.
+# TTLCache não é thread-safe e as rotas `def` rodam no threadpool: todo acesso passa pelo lock.
+_sessao_cache: TTLCache = TTLCache(maxsize=10000, ttl=30)
+_sessao_lock = threading.Lock()
+
+def chave_sessao(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def simular_envio_email(email: str, token: str, tipo: str = "verificacao", uid: int | None = None):
     if tipo == "verificacao":
-        base_api_url = os.getenv("BASE_API_URL", "http://127.0.0.1:8000")
-        link = f"{base_api_url}/cliente/verificar-email?token={token}"
+        link = f"{BASE_API_URL}/cliente/verificar-email?token={token}"
     else:
         if "?" in FRONTEND_LOGIN_URL:
             link = f"{FRONTEND_LOGIN_URL}&reset_token={token}"
         else:
             link = f"{FRONTEND_LOGIN_URL}?reset_token={token}"
+    if uid is not None:
+        link += f"&uid={uid}"
     
     logger.info("====================================================")
     logger.info(f"[SIMULAÇÃO DE EMAIL - {tipo.upper()}] Para: {mask_email(email)}")
     logger.info(f"[AÇÃO] Clique no link: {link}")
     logger.info("====================================================")
 
+# Limites do chat por edital
+MAX_PDF_BYTES = 50 * 1024 * 1024
+
+# Texto já extraído por edital: {edital_id: (tupla de urls, texto)}.
+# Guardamos as urls para não servir texto antigo se os anexos mudarem.
+_pdf_text_cache: TTLCache = TTLCache(maxsize=512, ttl=3600)
+_pdf_text_lock = threading.Lock()
+
+# Índice BM25 por edital: {edital_id: IndiceTrechos}. Validado pelo próprio texto,
+# então um texto novo (anexos alterados) reconstrói o índice.
+# Preenchido a partir do threadpool (run_in_threadpool): todo acesso passa pelo lock.
+_indice_cache: TTLCache = TTLCache(maxsize=128, ttl=3600)
+_indice_lock = threading.Lock()
+
+def obter_indice_edital(edital_id: int, texto: str) -> IndiceTrechos:
+    """
+    Retorna o índice de trechos do edital, montando-o só na primeira pergunta.
+    """
+    with _indice_lock:
+        indice = _indice_cache.get(edital_id)
+    if indice is None or indice.texto != texto:
+        # Indexação fora do lock; duas perguntas simultâneas no máximo indexam duas vezes
+        indice = indexar_trechos(texto)
+        with _indice_lock:
+            _indice_cache[edital_id] = indice
+    return indice
+
+def contexto_da_pergunta(edital_id: int, texto: str, pergunta: str) -> str:
+    return selecionar_trechos(obter_indice_edital(edital_id, texto), pergunta)
+
+# Cliente HTTP compartilhado (keep-alive + HTTP/2) para download dos PDFs.
+# Criado no startup e fechado no shutdown de cada worker.
+http_client: httpx.AsyncClient | None = None
+
+# Pool de processos para a extração de PDF (paralelismo real, sem disputar o GIL).
+# Cada worker do uvicorn/gunicorn tem o seu pool, então o orçamento é por host:
+# PDF_POOL_HOST_WORKERS processos (padrão: núcleos) divididos entre os
+# WEB_CONCURRENCY workers. PDF_POOL_WORKERS fixa o tamanho por worker, se definido.
+PDF_POOL_HOST_WORKERS = int(os.getenv("PDF_POOL_HOST_WORKERS", str(os.cpu_count() or 2)))
+WEB_CONCURRENCY = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+PDF_POOL_WORKERS = int(os.getenv("PDF_POOL_WORKERS", str(max(PDF_POOL_HOST_WORKERS // WEB_CONCURRENCY, 1))))
+pdf_pool: ProcessPoolExecutor | None = None
+
+async def baixar_pdf(url: str) -> bytes | None:
+    """
+    Baixa o PDF em streaming, abortando se passar de MAX_PDF_BYTES.
+    Evita carregar arquivos gigantes inteiros na memória antes de perceber o tamanho.
+    """
+    async with http_client.stream("GET", url) as r:
+        if r.status_code != 200:
+            return None
+        # Tamanho declarado já acima do limite: nem começa a ler o corpo
+        declarado = r.headers.get("content-length")
+        if declarado and declarado.isdigit() and int(declarado) > MAX_PDF_BYTES:
+            logger.warning(f"PDF ignorado por exceder {MAX_PDF_BYTES} bytes: {url}")
+            return None
+        buffer = bytearray()
+        async for chunk in r.aiter_bytes(64 * 1024):
+            buffer += chunk
+            if len(buffer) > MAX_PDF_BYTES:
+                logger.warning(f"PDF ignorado por exceder {MAX_PDF_BYTES} bytes: {url}")
+                return None
+        return bytes(buffer)
+
+async def baixar_e_extrair_texto(pdf_urls: list[str]) -> str:
+    """
+    Baixa os PDFs em paralelo e devolve o texto concatenado (já truncado).
+    """
+    # Downloads em paralelo: latência total ~ do PDF mais lento, não a soma
+    downloads = await asyncio.gather(*[baixar_pdf(u) for u in pdf_urls], return_exceptions=True)
+
+    validos = []
+    for url, conteudo in zip(pdf_urls, downloads):
+        if isinstance(conteudo, Exception):
+            logger.error(f"Erro ao baixar PDF {url}: {conteudo}")
+        elif conteudo:
+            validos.append((url, conteudo))
+
+    # Extração (CPU-bound) em paralelo no pool de processos, fora do event loop
+    loop = asyncio.get_running_loop()
+    textos = await asyncio.gather(
+        *[loop.run_in_executor(pdf_pool, extrair_texto_pdf, conteudo) for _, conteudo in validos],
+        return_exceptions=True
+    )
+
+    partes = []
+    for (url, _), trecho in zip(validos, textos):
+        if isinstance(trecho, Exception):
+            logger.error(f"Erro ao ler PDF {url}: {trecho}")
+            continue
+        partes.append(trecho)
+
+    return "".join(partes)[:MAX_TEXTO_EDITAL]
+
+# Acesso síncrono ao banco usado pelas rotas async do chat.
+# Roda via run_in_threadpool (mesmo pool das rotas `def`), nunca direto no event loop.
+def _ler_anexos_edital(db: Session, edital_id: int):
+    # Só as colunas usadas no chat; nada de hidratar o edital inteiro (json_data, texto_extraido).
+    # atualizado_em é a versão do edital lida antes do download (ver _salvar_texto_extraido).
+    return db.execute(
+        select(Edital.arquivos_json, Edital.pdf_url, Edital.atualizado_em).where(Edital.id == edital_id)
+    ).first()
+
+def _ler_texto_extraido(db: Session, edital_id: int) -> str | None:
+    return db.execute(select(Edital.texto_extraido).where(Edital.id == edital_id)).scalar()
+
+def _salvar_texto_extraido(db: Session, edital_id: int, texto: str, versao: datetime | None) -> None:
+    # Só grava se o edital não foi editado desde a leitura dos anexos: uma extração
+    # dos PDFs antigos que termine depois do PUT não pode regravar texto velho.
+    # Mantém atualizado_em: o cache de texto não muda o conteúdo listado em /editais
+    mesma_versao = Edital.atualizado_em == versao if versao is not None else Edital.atualizado_em.is_(None)
+    resultado = db.execute(
+        update(Edital)
+        .where(Edital.id == edital_id, mesma_versao)
+        .values(texto_extraido=texto, atualizado_em=Edital.atualizado_em)
+    )
+    db.commit()
+    if resultado.rowcount == 0:
+        logger.info(f"[CHAT] Edital {edital_id} alterado durante a extração; texto descartado")
+
+async def obter_texto_edital(db: Session, edital_id: int, pdf_urls: list[str], versao: datetime | None) -> str:
+    """
+    Retorna o texto dos PDFs do edital, nesta ordem de preferência:
+    1. cache em memória do processo;
+    2. coluna texto_extraido (sobrevive a restarts; zerada ao editar o edital);
+    3. download + extração, persistindo o resultado nas duas camadas.
+    """
+    chave_urls = tuple(pdf_urls)
+    with _pdf_text_lock:
+        cache = _pdf_text_cache.get(edital_id)
+    if cache and cache[0] == chave_urls:
+        return cache[1]
+
+    texto = await run_in_threadpool(_ler_texto_extraido, db, edital_id)
+    if not texto:
+        texto = await baixar_e_extrair_texto(pdf_urls)
+        if texto.strip():
+            await run_in_threadpool(_salvar_texto_extraido, db, edital_id, texto, versao)
+
+    if texto.strip():
+        with _pdf_text_lock:
+            _pdf_text_cache[edital_id] = (chave_urls, texto)
+    return texto
+
 # =========================
 # Middleware de Log
 # =========================
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    logger.info(f"{request.method} {request.url}")
-    response = await call_next(request)
-    return response
+# Rotas de probe (Azure/load balancer): logadas só numa fração das vezes.
+# LOG_SAMPLE_RATE=0 desliga o log delas; 1 loga todas. As demais rotas sempre logam.
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+_ROTAS_PROBE = frozenset({"/ping", "/health", "/"})
+
+class LogMiddleware:
+    """
+    Middleware ASGI puro: loga método + caminho sem criar Request/Response
+    nem o wrapper de streaming do BaseHTTPMiddleware a cada request.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        if scope["path"] in _ROTAS_PROBE and random.random() >= LOG_SAMPLE_RATE:
+            return await self.app(scope, receive, send)
+        query = scope.get("query_string", b"")
+        if query:
+            logger.info(f'{scope["method"]} {scope["path"]}?{query.decode("latin-1")}')
+        else:
+            logger.info(f'{scope["method"]} {scope["path"]}')
+        await self.app(scope, receive, send)
+
+app.add_middleware(LogMiddleware)
 
 # =========================
 # Routes Public / System
@@ -233,7 +525,7 @@ def health_check(db: Session = Depends(get_db)):
         status_report["status"] = "degraded"
         status_report["components"]["database"] = str(e)
 
-    if client:
+    if OPENAI_CONFIGURADO:
         status_report["components"]["openai"] = "configured"
     else:
         status_report["components"]["openai"] = "not_configured"
@@ -247,22 +539,79 @@ def health_check(db: Session = Depends(get_db)):
 def root():
     return {"msg": "API Atimus Online."}
 
+# Listagem já serializada por (after, limit): {chave: (etag, corpo_json)}.
+# Limpa nas rotas de escrita deste worker; nos demais vale no máximo o TTL.
+# Rotas `def` (threadpool) e TTLCache não é thread-safe: todo acesso passa pelo lock.
+_editais_cache: TTLCache = TTLCache(maxsize=256, ttl=30)
+_editais_lock = threading.Lock()
+
+# Lista pública: navegador/CDN reaproveitam por 60s e, depois disso, podem servir a
+# cópia antiga por até 5 min enquanto revalidam (If-None-Match → 304) em background
+EDITAIS_CACHE_CONTROL = "public, max-age=60, stale-while-revalidate=300"
+
+def json_valido(texto: str) -> bool:
+    try:
+        orjson.loads(texto)
+        return True
+    except orjson.JSONDecodeError:
+        return False
+
 @app.get("/editais")
-def listar_editais(db: Session = Depends(get_db)):
-    resultados = db.query(Edital).all()
+def listar_editais(
+    request: Request,
+    after: int | None = Query(default=None, ge=0),
+    limit: int | None = Query(default=None, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    chave = (after, limit)
+    with _editais_lock:
+        cache = _editais_cache.get(chave)
+    if cache:
+        etag, corpo = cache
+        headers = {"ETag": etag, "Cache-Control": EDITAIS_CACHE_CONTROL}
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(content=corpo, media_type="application/json", headers=headers)
+
+    # ETag barato: última atualização + total de editais. Se o cliente já tem
+    # essa versão, responde 304 sem montar (nem serializar) a lista.
+    ultima_atualizacao, total = db.execute(
+        select(func.max(Edital.atualizado_em), func.count(Edital.id))
+    ).one()
+    etag = '"' + hashlib.md5(f"{ultima_atualizacao}-{total}".encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": EDITAIS_CACHE_CONTROL}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    # Projeção explícita: devolve Rows leves em vez de hidratar objetos ORM.
+    # Paginação por cursor (?after=<último id>&limit=N), sem OFFSET.
+    # Sem `limit` mantém o comportamento antigo (lista completa) para o frontend atual.
+    stmt = select(
+        Edital.id,
+        Edital.titulo,
+        # json_data sai como texto cru (sem passar pelo JSONTexto) e é embutido
+        # na resposta via orjson.Fragment, sem parse + re-serialização por linha
+        # (o corpo final é validado uma vez antes de ir para o cache, abaixo)
+        type_coerce(Edital.json_data, UnicodeText).label("json_data"),
+        Edital.arquivos_json,
+        Edital.data_final_submissao,
+        Edital.pdf_url
+    ).order_by(Edital.id)
+    if after is not None:
+        stmt = stmt.where(Edital.id > after)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    # yield_per: busca em lotes do cursor em vez de materializar todas as linhas antes do loop
+    resultados = db.execute(stmt.execution_options(yield_per=500))
     frontend_url = FRONTEND_APP_URL
 
     lista = []
+    brutos = []
     for r in resultados:
-        try:
-            json_data = json.loads(r.json_data) if r.json_data else {}
-        except Exception:
-            json_data = {}
-
-        try:
-            arquivos = json.loads(r.arquivos_json) if r.arquivos_json else []
-        except Exception:
-            arquivos = []
+        json_data = orjson.Fragment(r.json_data) if r.json_data else {}
+        brutos.append(r.json_data)
+        # arquivos_json (JSONTexto): já chega desserializado (None se vazio/inválido)
+        arquivos = list(r.arquivos_json or [])
 
         if not arquivos and r.pdf_url:
             arquivos.append({
@@ -279,18 +628,65 @@ def listar_editais(db: Session = Depends(get_db)):
             "share_link": f"{frontend_url}?id={r.id}"
         })
 
-    return JSONResponse(content=lista)
+    corpo = orjson.dumps(lista)
+    # O Fragment não valida o texto: um json_data inválido (ex: editado direto no
+    # banco) quebraria a lista toda e ficaria no cache. Um parse por rebuild do cache.
+    try:
+        orjson.loads(corpo)
+    except orjson.JSONDecodeError:
+        for item, bruto in zip(lista, brutos):
+            if bruto and not json_valido(bruto):
+                logger.warning(f"[EDITAIS] json_data inválido no edital {item['id']}; servindo {{}}")
+                item["json_data"] = {}
+        corpo = orjson.dumps(lista)
+    with _editais_lock:
+        _editais_cache[chave] = (etag, corpo)
+    return Response(content=corpo, media_type="application/json", headers=headers)
 
 # =========================
 # Fluxo Cliente: Auth & Cadastro
 # =========================
+# Statements montados uma vez no import: o SQL compilado fica no cache do engine
+# e cada request só troca o parâmetro. Trazem só as colunas usadas pelo /cliente/me.
+_Q_CLIENTE_BY_TOKEN_HASH = select(
+    Cliente.id,
+    Cliente.nome,
+    Cliente.email_verificado,
+    Cliente.token_expiration
+).where(Cliente.token_hash == bindparam("tok_hash"))
+
+# Legado: sessões criadas antes do token_hash guardavam o token cru
+_Q_CLIENTE_BY_TOKEN = select(
+    Cliente.id,
+    Cliente.nome,
+    Cliente.email_verificado,
+    Cliente.token_expiration
+).where(Cliente.token == bindparam("tok"))
+
 @app.get("/cliente/me")
 def cliente_me(cliente_token: str | None = Cookie(default=None), db: Session = Depends(get_db)):
     # Log para debug em produção
     if not cliente_token:
         return JSONResponse(status_code=401, content={"logado": False, "msg": "Cookie não encontrado"})
     
-    cliente = db.query(Cliente).filter(Cliente.token == cliente_token).first()
+    now = datetime.utcnow()
+
+    # Sessão já validada recentemente neste worker: responde sem ir ao banco
+    chave = chave_sessao(cliente_token)
+    with _sessao_lock:
+        sessao = _sessao_cache.get(chave)
+    if sessao:
+        cliente_id, nome, expiracao = sessao
+        if expiracao is None or now <= expiracao:
+            return {"logado": True, "nome": nome, "id": cliente_id, "redirect": FRONTEND_APP_URL}
+
+    cliente = db.execute(_Q_CLIENTE_BY_TOKEN_HASH, {"tok_hash": chave}).first()
+    if not cliente:
+        cliente = db.execute(_Q_CLIENTE_BY_TOKEN, {"tok": cliente_token}).first()
+        if cliente:
+            # Sessão legada: passa a valer pelo hash e o token cru sai do banco
+            db.execute(update(Cliente).where(Cliente.id == cliente.id).values(token_hash=chave, token=None))
+            db.commit()
     
     if not cliente:
         return JSONResponse(status_code=401, content={"logado": False, "msg": "Sessão inválida"})
@@ -298,7 +694,6 @@ def cliente_me(cliente_token: str | None = Cookie(default=None), db: Session = D
     if not cliente.email_verificado:
         return JSONResponse(status_code=403, content={"logado": False, "msg": "Email não verificado"})
     
-    now = datetime.utcnow()
     token_expiration_naive = force_naive_utc(cliente.token_expiration)
 
     if token_expiration_naive and now > token_expiration_naive:
@@ -306,18 +701,27 @@ def cliente_me(cliente_token: str | None = Cookie(default=None), db: Session = D
     
     # Renovação de Sessão (Rolling Session)
     if token_expiration_naive and (token_expiration_naive - now).days < 5:
-        cliente.token_expiration = now + timedelta(days=30)
+        token_expiration_naive = now + timedelta(days=30)
+        db.execute(
+            update(Cliente).where(Cliente.id == cliente.id).values(token_expiration=token_expiration_naive)
+        )
         db.commit()
+
+    with _sessao_lock:
+        _sessao_cache[chave] = (cliente.id, cliente.nome, token_expiration_naive)
     
     return {"logado": True, "nome": cliente.nome, "id": cliente.id, "redirect": FRONTEND_APP_URL}
 
 @app.post("/cliente/cadastro")
 def cadastro_cliente(dados: CadastroCliente, db: Session = Depends(get_db)):
-    existente = db.query(Cliente).filter(or_(Cliente.email == dados.email, Cliente.cnpj == dados.cnpj)).first()
+    # Só precisamos saber se existe: busca apenas o id
+    existente = db.execute(
+        select(Cliente.id).where(or_(Cliente.email == dados.email, Cliente.cnpj == dados.cnpj))
+    ).first()
     if existente:
         return JSONResponse(status_code=400, content={"detail": "E-mail ou CNPJ já cadastrados. Tente fazer login."}) 
 
-    verificacao_token = str(uuid.uuid4())
+    verificacao_token = secrets.token_urlsafe(32)
     
     novo_cliente = Cliente(
         nome=dados.nome,
@@ -328,30 +732,53 @@ def cadastro_cliente(dados: CadastroCliente, db: Session = Depends(get_db)):
         contato_ok=dados.contato_ok,
         politica_ok=dados.politica_ok,
         email_verificado=False,
-        email_token=verificacao_token,
+        # Só o hash vai para o banco, como no reset de senha
+        email_token=hash_token(verificacao_token),
         email_token_expiration=datetime.utcnow() + timedelta(hours=72)
     )
     db.add(novo_cliente)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        # Corrida entre dois cadastros simultâneos: os índices únicos de email/cnpj barram o segundo
+        db.rollback()
+        return JSONResponse(status_code=400, content={"detail": "E-mail ou CNPJ já cadastrados. Tente fazer login."})
 
-    enviado = enviar_email_verificacao(dados.email, verificacao_token)
+    enviado = enviar_email_verificacao(dados.email, verificacao_token, novo_cliente.id)
     if not enviado:
-        simular_envio_email(dados.email, verificacao_token, "verificacao")
+        simular_envio_email(dados.email, verificacao_token, "verificacao", novo_cliente.id)
 
     logger.info(f"Novo cadastro iniciado: {mask_email(dados.email)}")
     return {"sucesso": True, "msg": "Cadastro realizado! Verifique seu e-mail para ativar a conta."}
 
-@app.post("/cliente/login")
+# Rotas com bcrypt (login/cadastro) continuam `def`: rodam no threadpool do Starlette,
+# fora do event loop. Torná-las async exigiria tirar também a Session síncrona do loop.
+@app.post("/cliente/login", dependencies=[Depends(rate_limit("login", max_requisicoes=5, janela=60))])
 def login_cliente(dados: LoginCliente, db: Session = Depends(get_db)):
-    cliente = db.query(Cliente).filter(Cliente.email == dados.email).first()
-    if not cliente or not verificar_senha(dados.senha, cliente.senha_hash):
+    # Carrega só as colunas lidas/alteradas no login
+    cliente = db.query(Cliente).options(load_only(
+        Cliente.id, Cliente.email, Cliente.senha_hash, Cliente.email_verificado,
+        Cliente.token, Cliente.token_hash, Cliente.reset_token_hash
+    )).filter(Cliente.email == dados.email).first()
+    if not cliente:
+        simular_verificacao_senha(dados.senha)
+        return JSONResponse(status_code=401, content={"detail": "E-mail ou senha incorretos."}) 
+    if not verificar_senha(dados.senha, cliente.senha_hash):
         return JSONResponse(status_code=401, content={"detail": "E-mail ou senha incorretos."}) 
     
     if not cliente.email_verificado:
         return JSONResponse(status_code=403, content={"detail": "Seu e-mail ainda não foi verificado. Verifique sua caixa de entrada."}) 
 
-    sessao_token = str(uuid.uuid4())
-    cliente.token = sessao_token
+    sessao_token = secrets.token_urlsafe(32)
+    # A sessão anterior deixa de valer (no banco e no cache local)
+    with _sessao_lock:
+        if cliente.token_hash:
+            _sessao_cache.pop(cliente.token_hash, None)
+        if cliente.token:
+            _sessao_cache.pop(chave_sessao(cliente.token), None)
+    # Só o hash vai para o banco; o token cru fica apenas no cookie
+    cliente.token_hash = chave_sessao(sessao_token)
+    cliente.token = None
     cliente.token_expiration = datetime.utcnow() + timedelta(days=30)
     
     # Security cleanup
@@ -385,9 +812,25 @@ def login_cliente(dados: LoginCliente, db: Session = Depends(get_db)):
 
     return response
 
+# Formato do hash_token (SHA-256 em hex)
+_HASH_TOKEN_RE = re.compile(r"[0-9a-f]{64}")
+
 @app.get("/cliente/verificar-email")
-def verificar_email(token: str, db: Session = Depends(get_db)):
-    cliente = db.query(Cliente).filter(Cliente.email_token == token).first()
+def verificar_email(token: str, uid: int | None = None, db: Session = Depends(get_db)):
+    hashed_input = hash_token(token)
+    if uid is not None:
+        # Busca pelo id (não secreto) e compara o hash em tempo constante,
+        # sem o `=` do banco, que para no primeiro byte diferente
+        cliente = db.get(Cliente, uid)
+        if cliente and not (cliente.email_token and hmac.compare_digest(cliente.email_token, hashed_input)):
+            cliente = None
+    elif _HASH_TOKEN_RE.fullmatch(token):
+        # Com cara de hash (64 hex): só compara o hash. Aceitar o valor cru aqui
+        # deixaria quem lê o hash gravado usá-lo como se fosse o próprio token.
+        cliente = db.query(Cliente).filter(Cliente.email_token == hashed_input).first()
+    else:
+        # Links antigos (sem uid, token uuid4 gravado cru, nunca 64 hex)
+        cliente = db.query(Cliente).filter(Cliente.email_token.in_([hashed_input, token])).first()
     
     if not cliente:
         return JSONResponse(status_code=400, content={"detail": "Token inválido ou não encontrado."}) 
@@ -409,9 +852,11 @@ def verificar_email(token: str, db: Session = Depends(get_db)):
 # =========================
 # Recuperação de Senha
 # =========================
-@app.post("/cliente/esqueci-senha")
+@app.post("/cliente/esqueci-senha", dependencies=[Depends(rate_limit("esqueci-senha", max_requisicoes=5, janela=60))])
 def esqueci_senha(req: EsqueciSenhaRequest, db: Session = Depends(get_db)):
-    cliente = db.query(Cliente).filter(Cliente.email == req.email).first()
+    cliente = db.query(Cliente).options(
+        load_only(Cliente.id, Cliente.email, Cliente.reset_token_expiration)
+    ).filter(Cliente.email == req.email).first()
     msg_padrao = "Se este e-mail estiver cadastrado, você receberá um link de recuperação."
 
     if cliente:
@@ -431,9 +876,9 @@ def esqueci_senha(req: EsqueciSenhaRequest, db: Session = Depends(get_db)):
         cliente.reset_token_expiration = now + timedelta(minutes=30)
         db.commit()
 
-        enviado = enviar_email_recuperacao(cliente.email, raw_token)
+        enviado = enviar_email_recuperacao(cliente.email, raw_token, cliente.id)
         if not enviado:
-             simular_envio_email(cliente.email, raw_token, "recuperacao")
+             simular_envio_email(cliente.email, raw_token, "recuperacao", cliente.id)
 
     return {"msg": msg_padrao}
 
@@ -444,16 +889,37 @@ def redefinir_senha(req: RedefinirSenhaRequest, db: Session = Depends(get_db)):
 
     hashed_input = hash_token(req.token)
     
-    cliente = db.query(Cliente).filter(
-        Cliente.reset_token_hash == hashed_input,
-        Cliente.reset_token_expiration > datetime.utcnow()
-    ).first()
+    if req.uid is not None:
+        # Busca pelo id e compara o hash em tempo constante
+        cliente = db.get(Cliente, req.uid)
+        if cliente:
+            expiracao = force_naive_utc(cliente.reset_token_expiration)
+            valido = (
+                cliente.reset_token_hash is not None
+                and hmac.compare_digest(cliente.reset_token_hash, hashed_input)
+                and expiracao is not None
+                and expiracao > datetime.utcnow()
+            )
+            if not valido:
+                cliente = None
+    else:
+        # Frontend sem uid: busca pelo hash (compara SHA-256 com pepper, não o token)
+        cliente = db.query(Cliente).filter(
+            Cliente.reset_token_hash == hashed_input,
+            Cliente.reset_token_expiration > datetime.utcnow()
+        ).first()
     
     if not cliente:
         return JSONResponse(status_code=400, content={"detail": "Link inválido ou expirado. Solicite um novo."}) 
     
     cliente.senha_hash = hash_senha(req.nova_senha)
+    with _sessao_lock:
+        if cliente.token_hash:
+            _sessao_cache.pop(cliente.token_hash, None)
+        if cliente.token:
+            _sessao_cache.pop(chave_sessao(cliente.token), None)
     cliente.token = None
+    cliente.token_hash = None
     cliente.token_expiration = None
     cliente.reset_token_hash = None
     cliente.reset_token_expiration = None
@@ -464,65 +930,119 @@ def redefinir_senha(req: RedefinirSenhaRequest, db: Session = Depends(get_db)):
 # =========================
 # Chat / Admin
 # =========================
-@app.post("/chat")
-async def chat_search(msg: ChatMessage, db: Session = Depends(get_db)):
+_GREETINGS = frozenset({
+    "oi", "ola", "olá", "bom dia", "boa tarde", "boa noite",
+    "opa", "eai", "tudo bem", "help", "ajuda"
+})
+
+# Siglas curtas que são busca válida, apesar de terem menos de 3 letras
+_SHORT_EXCEPT = frozenset({"ia", "ai"})
+
+# Termos de busca: palavras com 3+ letras/dígitos (pontuação fica de fora)
+# ou uma das siglas de _SHORT_EXCEPT
+_TOKEN_RE = re.compile(r"\w{3,}|\b(?:" + "|".join(sorted(_SHORT_EXCEPT)) + r")\b", re.IGNORECASE)
+
+# `def`: a busca é só banco (síncrono), então roda no threadpool e não no event loop
+@app.post("/chat", dependencies=[Depends(rate_limit("chat", max_requisicoes=30, janela=60))])
+def chat_search(msg: ChatMessage, db: Session = Depends(get_db)):
     if not msg.message or not msg.message.strip():
         return {"reply": "Me diga algo para eu procurar (ex: Inovação, Saúde, Finep)."}
     user_text = msg.message.strip()
-    termos = [t for t in user_text.split() if len(t) > 2]
+    text_lower = user_text.lower()
+    # Saudações e mensagens curtas não viram busca no banco
+    if text_lower in _GREETINGS or (len(text_lower) < 3 and text_lower not in _SHORT_EXCEPT):
+        return {"reply": "Me diga algo para eu procurar (ex: Inovação, Saúde, Finep)."}
+    termos = _TOKEN_RE.findall(user_text)
     if not termos:
         return {"reply": "Use palavras mais específicas como Inovação, Tecnologia, Saúde."}
-    filtros = [or_(Edital.titulo.ilike(f"%{t}%"), Edital.json_data.ilike(f"%{t}%")) for t in termos]
-    resultados = db.query(Edital).filter(or_(*filtros)).limit(5).all()
+    resultados = buscar_editais_chat(db, termos)
     if not resultados:
         return {"reply": "Não encontrei editais com esses termos. Tente algo mais geral."}
     return {"reply": "Encontrei estes editais:", "options": [{"id": r.id, "titulo": r.titulo} for r in resultados]}
 
+def eventos_sse(stream):
+    """
+    Converte o stream do OpenAI em eventos SSE (`data: {"delta": ...}`), terminando com `data: [DONE]`.
+    Gerador síncrono: o StreamingResponse itera no threadpool, fora do event loop.
+    """
+    try:
+        for chunk in stream:
+            # O Azure manda chunks sem choices (ex: resultado do filtro de conteúdo)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield b"data: " + orjson.dumps({"delta": delta}) + b"\n\n"
+    except Exception as e:
+        logger.error(f"Erro no streaming do chat: {e}")
+        yield b"data: " + orjson.dumps({"error": "Falha ao gerar a resposta."}) + b"\n\n"
+    finally:
+        stream.close()
+    yield b"data: [DONE]\n\n"
+
 @app.post("/chat/edital/{edital_id}")
-async def chat_edital(edital_id: int, msg: ChatMessage, db: Session = Depends(get_db)):
+async def chat_edital(edital_id: int, msg: ChatMessage, request: Request, db: Session = Depends(get_db)):
+    client = get_openai_client()
     if not client:
         return {"reply": "Chat indisponível no momento. (Azure OpenAI não configurado)."}
-    edital = db.query(Edital).filter(Edital.id == edital_id).first()
+    edital = await run_in_threadpool(_ler_anexos_edital, db, edital_id)
     if not edital:
         return {"reply": "Edital não encontrado."}
-    try:
-        arquivos = json.loads(edital.arquivos_json) if edital.arquivos_json else []
-    except Exception:
-        arquivos = []
+    arquivos = list(edital.arquivos_json or [])
     if not arquivos and edital.pdf_url:
         arquivos.append({"url": edital.pdf_url})
     pdf_urls = [a.get("url") for a in arquivos if a.get("url", "").lower().endswith(".pdf")]
     if not pdf_urls:
         return {"reply": "Este edital não possui PDF."}
-    texto = ""
-    for url in pdf_urls:
-        try:
-            r = requests.get(url, timeout=10)
-            if r.status_code == 200:
-                reader = PdfReader(io.BytesIO(r.content))
-                for page in reader.pages:
-                    texto += page.extract_text() or ""
-        except Exception as e:
-            logger.error(f"Erro ao ler PDF {url}: {e}")
+    texto = await obter_texto_edital(db, edital_id, pdf_urls, edital.atualizado_em)
     if not texto.strip():
         return {"reply": "Não consegui extrair texto do edital."}
-    texto = texto[:200_000]
-    response = client.chat.completions.create(
+    # Só os trechos mais relevantes para a pergunta vão ao modelo (BM25 local),
+    # em vez do texto inteiro do edital
+    contexto = await run_in_threadpool(contexto_da_pergunta, edital_id, texto, msg.message)
+    mensagens = [
+        {"role": "system", "content": "Você é um assistente especializado em editais. Responda apenas com base no texto fornecido."}, 
+        {"role": "user", "content": f"Pergunta: {msg.message}\n\n{contexto}"}
+    ]
+
+    # Opt-in (Accept: text/event-stream): os tokens vão para o navegador via SSE
+    # à medida que o modelo gera. Sem o header, mantém o JSON {"reply": ...}.
+    if "text/event-stream" in request.headers.get("accept", ""):
+        stream = await run_in_threadpool(
+            client.chat.completions.create,
+            model=DEPLOYMENT_NAME,
+            messages=mensagens,
+            max_completion_tokens=2048,
+            stream=True
+        )
+        return StreamingResponse(
+            eventos_sse(stream),
+            media_type="text/event-stream",
+            # Content-Encoding: identity tira a resposta do GZipMiddleware, que
+            # acumularia os eventos e só entregaria tudo no fim
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Content-Encoding": "identity"}
+        )
+
+    # O SDK do OpenAI é síncrono: a chamada (segundos) roda fora do event loop, no
+    # threadpool do Starlette (THREADPOOL_TOKENS), não no executor padrão do asyncio
+    # (min(32, cpu+4) threads, que alguns chats simultâneos esgotariam)
+    response = await run_in_threadpool(
+        client.chat.completions.create,
         model=DEPLOYMENT_NAME,
-        messages=[
-            {"role": "system", "content": "Você é um assistente especializado em editais. Responda apenas com base no texto fornecido."}, 
-            {"role": "user", "content": f"Pergunta: {msg.message}\n\n{texto}"}
-        ],
+        messages=mensagens,
         max_completion_tokens=2048
     )
     return {"reply": response.choices[0].message.content}
 
+# Mantida como `def` (não async): o Starlette executa a rota no threadpool,
+# então o bcrypt de verificar_senha não bloqueia o event loop.
 @app.post("/admin/login")
 def login_admin(login: LoginAdmin = Body(...), db: Session = Depends(get_db)):
     logger.info(f"[ADMIN LOGIN] Tentativa para: {login.email}")
     user = db.query(User).filter(User.email == login.email).first()
     
     if not user:
+        simular_verificacao_senha(login.senha)
         logger.warning(f"[ADMIN LOGIN] Falha: Usuário {login.email} não encontrado.")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas")
     
@@ -536,16 +1056,16 @@ def login_admin(login: LoginAdmin = Body(...), db: Session = Depends(get_db)):
     logger.info(f"[ADMIN LOGIN] Sucesso para: {login.email}")
     return {"access_token": token, "token_type": "bearer"}
 
+# Defina isso no Azure App Settings ou use o valor padrão abaixo apenas para testes
+ADMIN_SETUP_SECRET = os.getenv("ADMIN_SETUP_SECRET", "admin123_setup_key")
+
 @app.post("/admin/setup-user")
 def setup_admin_user(dados: AdminSetup, db: Session = Depends(get_db)):
     """
     Rota auxiliar para criar/resetar usuário admin com hash correto.
     Usa uma secret_key simples para proteção básica em ambiente de dev/teste.
     """
-    # Defina isso no Azure App Settings ou use o valor padrão abaixo apenas para testes
-    SETUP_SECRET = os.getenv("ADMIN_SETUP_SECRET", "admin123_setup_key")
-    
-    if dados.secret_key != SETUP_SECRET:
+    if dados.secret_key != ADMIN_SETUP_SECRET:
         logger.warning(f"[ADMIN SETUP] Tentativa não autorizada com chave: {dados.secret_key}")
         raise HTTPException(status_code=403, detail="Chave de setup inválida")
 
@@ -578,33 +1098,52 @@ def criar_edital(dados: dict = Body(...), db: Session = Depends(get_db), user: d
     attachments = dados.get("attachments", [])
     conteudo = dados.copy()
     conteudo.pop("attachments", None)
-    novo = Edital(
-        titulo=dados.get("titulo", "Sem Título"),
-        data_final_submissao=parse_date(dados.get("data_final_submissao")),
-        pdf_url=attachments[0].get("url") if attachments else "",
-        json_data=json.dumps(conteudo),
-        arquivos_json=json.dumps(attachments)
-    )
-    db.add(novo)
+    # INSERT ... RETURNING id: um único round-trip, sem o SELECT extra do db.refresh
+    novo_id = db.execute(
+        insert(Edital).values(
+            titulo=dados.get("titulo", "Sem Título"),
+            data_final_submissao=parse_date(dados.get("data_final_submissao")),
+            pdf_url=attachments[0].get("url") if attachments else "",
+            json_data=conteudo,
+            texto_busca=texto_para_busca(conteudo),
+            arquivos_json=attachments
+        ).returning(Edital.id)
+    ).scalar_one()
     db.commit()
-    db.refresh(novo)
-    return {"msg": "Edital criado com sucesso", "id": novo.id, "share_link": f"{FRONTEND_APP_URL}?id={novo.id}"}
+    with _editais_lock:
+        _editais_cache.clear()
+    return {"msg": "Edital criado com sucesso", "id": novo_id, "share_link": f"{FRONTEND_APP_URL}?id={novo_id}"}
 
 @app.put("/admin/editais/{edital_id}")
 def atualizar_edital(edital_id: int, dados: dict = Body(...), db: Session = Depends(get_db), user: dict = Depends(get_current_user)):
     if user.get("role") != "admin":
         raise HTTPException(status_code=403, detail="Acesso negado")
-    edital = db.query(Edital).filter(Edital.id == edital_id).first()
-    if not edital:
-        raise HTTPException(status_code=404, detail="Edital não encontrado")
     attachments = dados.get("attachments", [])
     conteudo = dados.copy()
     conteudo.pop("attachments", None)
-    edital.titulo = dados.get("titulo", edital.titulo)
-    edital.data_final_submissao = parse_date(dados.get("data_final_submissao"))
+    valores = {
+        "data_final_submissao": parse_date(dados.get("data_final_submissao")),
+        "json_data": conteudo,
+        "texto_busca": texto_para_busca(conteudo),
+        "arquivos_json": attachments,
+        # Anexos podem ter mudado: descarta o texto extraído (banco + memória)
+        "texto_extraido": None,
+    }
+    # Campos ausentes no payload mantêm o valor atual
+    if "titulo" in dados:
+        valores["titulo"] = dados["titulo"]
     if attachments:
-        edital.pdf_url = attachments[0].get("url")
-    edital.json_data = json.dumps(conteudo)
-    edital.arquivos_json = json.dumps(attachments)
+        valores["pdf_url"] = attachments[0].get("url")
+    # UPDATE direto: um único round-trip, sem o SELECT do db.get antes
+    resultado = db.execute(update(Edital).where(Edital.id == edital_id).values(**valores))
+    if resultado.rowcount == 0:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Edital não encontrado")
     db.commit()
+    with _pdf_text_lock:
+        _pdf_text_cache.pop(edital_id, None)
+    with _indice_lock:
+        _indice_cache.pop(edital_id, None)
+    with _editais_lock:
+        _editais_cache.clear()
     return {"msg": "Edital atualizado com sucesso"}
@@ -0,0 +1,303 @@
+# API/migrations.py
+
+import logging
+from contextlib import contextmanager
+
+import orjson
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+from .database import engine as default_engine
+from .models import Base, texto_para_busca
+
+logger = logging.getLogger("api.migrations")
+
+# =========================
+# Migrações (DDL)
+# =========================
+
+# Chave do lock de banco que serializa as migrações entre processos
+LOCK_MIGRACOES = "atimus_migracoes"
+LOCK_MIGRACOES_PG = int.from_bytes(LOCK_MIGRACOES.encode()[:8], "big")  # pg_advisory_lock recebe um bigint
+LOCK_MIGRACOES_TIMEOUT_MS = 10 * 60 * 1000
+
+@contextmanager
+def lock_migracoes(engine: Engine):
+    """
+    Lock exclusivo no banco (sp_getapplock no SQL Server, pg_advisory_lock no
+    PostgreSQL) durante as migrações. Com AUTO_MIGRATE cada worker chama
+    aplicar_migracoes no startup: sem o lock, dois workers disputariam o mesmo
+    ALTER/CREATE INDEX. Quem chega depois espera e encontra tudo já aplicado.
+    Nos demais bancos (SQLite de dev) não há lock.
+    """
+    dialeto = engine.dialect.name
+    if dialeto not in ("mssql", "postgresql"):
+        yield
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if dialeto == "mssql":
+            resultado = conn.execute(text(
+                "SET NOCOUNT ON; DECLARE @r INT; "
+                "EXEC @r = sp_getapplock @Resource = :recurso, @LockMode = 'Exclusive', "
+                "@LockOwner = 'Session', @LockTimeout = :timeout; SELECT @r"
+            ), {"recurso": LOCK_MIGRACOES, "timeout": LOCK_MIGRACOES_TIMEOUT_MS}).scalar()
+            # 0 = concedido na hora, 1 = concedido após espera; negativo = timeout/erro
+            if resultado is None or resultado < 0:
+                raise RuntimeError(f"Não foi possível obter o lock de migração (sp_getapplock={resultado})")
+        else:
+            conn.execute(text("SELECT pg_advisory_lock(:chave)"), {"chave": LOCK_MIGRACOES_PG})
+        try:
+            yield
+        finally:
+            if dialeto == "mssql":
+                conn.execute(text(
+                    "EXEC sp_releaseapplock @Resource = :recurso, @LockOwner = 'Session'"
+                ), {"recurso": LOCK_MIGRACOES})
+            else:
+                conn.execute(text("SELECT pg_advisory_unlock(:chave)"), {"chave": LOCK_MIGRACOES_PG})
+
+def aplicar_migracoes(engine: Engine = default_engine) -> None:
+    """
+    Cria as tabelas e adiciona colunas/índices novos que ainda faltem.
+    Idempotente. Roda no startup de cada worker (AUTO_MIGRATE, padrão ligado) ou
+    uma vez por deploy via scripts/create_tables.py; o lock de banco garante que
+    só um processo migra por vez.
+    """
+    with lock_migracoes(engine):
+        _aplicar_migracoes(engine)
+
+def _aplicar_migracoes(engine: Engine) -> None:
+    # 1. Garante que tabelas existam
+    Base.metadata.create_all(bind=engine)
+    logger.info("Banco de dados: Estrutura base verificada.")
+
+    # 2. AUTO-MIGRATION: Adiciona colunas novas se faltarem
+    inspector = inspect(engine)
+    if inspector.has_table("clientes"):
+        columns = [c["name"] for c in inspector.get_columns("clientes")]
+
+        with engine.connect() as conn:
+            # Reset Token Hash
+            if "reset_token_hash" not in columns:
+                logger.info("MIGRATION: Adicionando coluna 'reset_token_hash'...")
+                conn.execute(text("ALTER TABLE clientes ADD reset_token_hash VARCHAR(255) NULL"))
+                conn.commit()
+
+            # Reset Token Expiration
+            if "reset_token_expiration" not in columns:
+                logger.info("MIGRATION: Adicionando coluna 'reset_token_expiration'...")
+                conn.execute(text("ALTER TABLE clientes ADD reset_token_expiration DATETIME NULL"))
+                conn.commit()
+
+            # Token (Session)
+            if "token" not in columns:
+                logger.info("MIGRATION: Adicionando coluna 'token'...")
+                conn.execute(text("ALTER TABLE clientes ADD token VARCHAR(255) NULL"))
+                conn.commit()
+
+            # Token Expiration (Session)
+            if "token_expiration" not in columns:
+                logger.info("MIGRATION: Adicionando coluna 'token_expiration'...")
+                conn.execute(text("ALTER TABLE clientes ADD token_expiration DATETIME NULL"))
+                conn.commit()
+
+            # Hash da sessão (SHA-256 binário)
+            if "token_hash" not in columns:
+                logger.info("MIGRATION: Adicionando coluna 'token_hash'...")
+                tipo_hash = {"mssql": "VARBINARY(32)", "postgresql": "BYTEA"}.get(engine.dialect.name, "BLOB")
+                conn.execute(text(f"ALTER TABLE clientes ADD token_hash {tipo_hash} NULL"))
+                conn.commit()
+
+        # Índices das colunas de busca da autenticação. O create_all só cria índices
+        # em tabelas novas; bancos antigos podem estar sem eles (full scan por login).
+        inspector = inspect(engine)
+        indices = inspector.get_indexes("clientes")
+        indexados = {
+            tuple(i["column_names"])[:1]
+            for i in indices + inspector.get_unique_constraints("clientes")
+        }
+        nomes_indices = {(i["name"] or "").lower() for i in indices}
+        # Índice filtrado/parcial: linhas sem token ficam fora do índice
+        filtrado = engine.dialect.name in ("mssql", "postgresql", "sqlite")
+
+        with engine.connect() as conn:
+            for coluna in ("email", "token", "email_token", "reset_token_hash"):
+                if (coluna,) in indexados:
+                    continue
+                logger.info(f"MIGRATION: Criando índice 'ix_clientes_{coluna}'...")
+                filtro = f" WHERE {coluna} IS NOT NULL" if filtrado and coluna != "email" else ""
+                conn.execute(text(f"CREATE INDEX ix_clientes_{coluna} ON clientes ({coluna}){filtro}"))
+                conn.commit()
+
+            # token_hash tem um único índice, o de cobertura do /cliente/me (ver models.py):
+            # a validação da sessão lê tudo do próprio índice, sem bookmark lookup na tabela.
+            if "ix_clientes_token_hash_cover" not in nomes_indices:
+                logger.info("MIGRATION: Criando índice de cobertura 'ix_clientes_token_hash_cover'...")
+                incluir = (
+                    " INCLUDE (id, nome, email_verificado, token_expiration)"
+                    if engine.dialect.name in ("mssql", "postgresql") else ""
+                )
+                filtro = " WHERE token_hash IS NOT NULL" if filtrado else ""
+                conn.execute(text(f"CREATE INDEX ix_clientes_token_hash_cover ON clientes (token_hash){incluir}{filtro}"))
+                conn.commit()
+
+            # Índice simples criado por versões anteriores: redundante com o de cobertura
+            if "ix_clientes_token_hash" in nomes_indices:
+                logger.info("MIGRATION: Removendo índice redundante 'ix_clientes_token_hash'...")
+                if engine.dialect.name == "mssql":
+                    conn.execute(text("DROP INDEX ix_clientes_token_hash ON clientes"))
+                else:
+                    conn.execute(text("DROP INDEX ix_clientes_token_hash"))
+                conn.commit()
+
+    if inspector.has_table("editais"):
+        edital_columns = [c["name"] for c in inspector.get_columns("editais")]
+
+        with engine.connect() as conn:
+            # Texto extraído dos PDFs (cache persistente do chat)
+            if "texto_extraido" not in edital_columns:
+                logger.info("MIGRATION: Adicionando coluna 'texto_extraido'...")
+                tipo_texto = "NVARCHAR(MAX)" if engine.dialect.name == "mssql" else "TEXT"
+                conn.execute(text(f"ALTER TABLE editais ADD texto_extraido {tipo_texto} NULL"))
+                conn.commit()
+
+            # Data de atualização (ETag do /editais)
+            if "atualizado_em" not in edital_columns:
+                logger.info("MIGRATION: Adicionando coluna 'atualizado_em'...")
+                tipo_data = "TIMESTAMP" if engine.dialect.name == "postgresql" else "DATETIME"
+                conn.execute(text(f"ALTER TABLE editais ADD atualizado_em {tipo_data} NULL"))
+                conn.commit()
+
+            # Texto de busca do /chat (valores do json_data achatados) + preenchimento
+            if "texto_busca" not in edital_columns:
+                logger.info("MIGRATION: Adicionando coluna 'texto_busca'...")
+                tipo_texto = "NVARCHAR(MAX)" if engine.dialect.name == "mssql" else "TEXT"
+                conn.execute(text(f"ALTER TABLE editais ADD texto_busca {tipo_texto} NULL"))
+                conn.commit()
+            preencher_texto_busca(conn)
+
+            # Busca full-text do /chat (apenas PostgreSQL): tsvector gerado + índice GIN
+            if engine.dialect.name == "postgresql" and "search_vec" not in edital_columns:
+                logger.info("MIGRATION: Adicionando coluna 'search_vec' + índice GIN...")
+                conn.execute(text(
+                    "ALTER TABLE editais ADD COLUMN search_vec tsvector GENERATED ALWAYS AS "
+                    "(to_tsvector('portuguese', coalesce(titulo, '') || ' ' || coalesce(json_data, ''))) STORED"
+                ))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_editais_search_vec ON editais USING GIN (search_vec)"))
+                conn.commit()
+
+        if engine.dialect.name == "mssql":
+            converter_texto_unicode_mssql(engine)
+            criar_fulltext_mssql(engine)
+
+    logger.info("Banco de dados: Migrações verificadas.")
+
+def preencher_texto_busca(conn) -> None:
+    """
+    Preenche texto_busca dos editais antigos (gravados antes da coluna existir).
+    SQL direto: não mexe em atualizado_em (o conteúdo listado não muda).
+    """
+    pendentes = conn.execute(text(
+        "SELECT id, json_data FROM editais WHERE texto_busca IS NULL AND json_data IS NOT NULL"
+    )).all()
+    if not pendentes:
+        return
+    logger.info(f"MIGRATION: Preenchendo 'texto_busca' de {len(pendentes)} editais...")
+    valores = []
+    for edital_id, json_data in pendentes:
+        try:
+            conteudo = orjson.loads(json_data)
+        except orjson.JSONDecodeError:
+            conteudo = None
+        valores.append({"id": edital_id, "texto": texto_para_busca(conteudo)})
+    conn.execute(text("UPDATE editais SET texto_busca = :texto WHERE id = :id"), valores)
+    conn.commit()
+
+def sanear_json_data(engine: Engine = default_engine) -> None:
+    """
+    Limpeza pontual: zera o json_data que não é JSON válido (linhas antigas ou
+    editadas direto no banco; as gravações da API passam pelo JSONTexto).
+    Lê e faz parse de todos os editais, então não faz parte do aplicar_migracoes
+    (que roda no startup de cada worker): roda só pelo scripts/create_tables.py.
+    O /editais já se protege sozinho; isto só evita o caminho lento a cada rebuild.
+    """
+    with engine.connect() as conn:
+        invalidos = []
+        for edital_id, json_data in conn.execute(text(
+            "SELECT id, json_data FROM editais WHERE json_data IS NOT NULL"
+        )):
+            try:
+                orjson.loads(json_data)
+            except orjson.JSONDecodeError:
+                invalidos.append({"id": edital_id})
+        if not invalidos:
+            return
+        logger.warning(f"MIGRATION: json_data inválido em {len(invalidos)} editais; gravando NULL: {[v['id'] for v in invalidos]}")
+        conn.execute(text("UPDATE editais SET json_data = NULL WHERE id = :id"), invalidos)
+        conn.commit()
+
+# Colunas de texto livre/JSON dos editais: precisam ser NVARCHAR(MAX) (o orjson grava UTF-8 cru)
+COLUNAS_UNICODE_EDITAIS = ("json_data", "arquivos_json", "texto_extraido", "texto_busca")
+
+def converter_texto_unicode_mssql(engine: Engine) -> None:
+    """
+    Converte para NVARCHAR(MAX) as colunas de texto dos editais que ainda estejam
+    como VARCHAR/TEXT (bancos criados quando o model declarava Text). Sem isso,
+    caracteres fora da code page da coluna são gravados como "?".
+    Coluna que está no índice full-text sai dele durante o ALTER e volta em seguida.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        tipos = dict(conn.execute(text(
+            "SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS WHERE TABLE_NAME = 'editais'"
+        )).all())
+        pendentes = [c for c in COLUNAS_UNICODE_EDITAIS if tipos.get(c) in ("varchar", "text")]
+        if not pendentes:
+            return
+        no_fulltext = {c for (c,) in conn.execute(text(
+            "SELECT c.name FROM sys.fulltext_index_columns fic "
+            "JOIN sys.columns c ON c.object_id = fic.object_id AND c.column_id = fic.column_id "
+            "WHERE fic.object_id = OBJECT_ID('editais')"
+        ))}
+        for coluna in pendentes:
+            logger.info(f"MIGRATION: Convertendo '{coluna}' para NVARCHAR(MAX)...")
+            if coluna in no_fulltext:
+                conn.execute(text(f"ALTER FULLTEXT INDEX ON editais DROP ({coluna})"))
+            conn.execute(text(f"ALTER TABLE editais ALTER COLUMN {coluna} NVARCHAR(MAX) NULL"))
+            if coluna in no_fulltext:
+                conn.execute(text(f"ALTER FULLTEXT INDEX ON editais ADD ({coluna})"))
+
+def criar_fulltext_mssql(engine: Engine) -> None:
+    """
+    Busca full-text do /chat no SQL Server: catálogo + índice em (titulo, texto_busca).
+    Ignorado se o Full-Text Search não estiver instalado na instância.
+    DDL de full-text não roda dentro de transação, daí o AUTOCOMMIT.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if not conn.execute(text("SELECT FULLTEXTSERVICEPROPERTY('IsFullTextInstalled')")).scalar():
+            logger.warning("MIGRATION: Full-Text Search indisponível; /chat segue com LIKE.")
+            return
+        if conn.execute(text("SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('editais')")).first():
+            # Índice criado antes do texto_busca: troca o JSON cru pelo texto achatado
+            colunas = {c for (c,) in conn.execute(text(
+                "SELECT c.name FROM sys.fulltext_index_columns fic "
+                "JOIN sys.columns c ON c.object_id = fic.object_id AND c.column_id = fic.column_id "
+                "WHERE fic.object_id = OBJECT_ID('editais')"
+            ))}
+            if "texto_busca" not in colunas:
+                logger.info("MIGRATION: Trocando 'json_data' por 'texto_busca' no índice full-text...")
+                conn.execute(text("ALTER FULLTEXT INDEX ON editais ADD (texto_busca)"))
+                if "json_data" in colunas:
+                    conn.execute(text("ALTER FULLTEXT INDEX ON editais DROP (json_data)"))
+            return
+
+        logger.info("MIGRATION: Criando catálogo e índice full-text em 'editais'...")
+        if not conn.execute(text("SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'edital_ft'")).first():
+            conn.execute(text("CREATE FULLTEXT CATALOG edital_ft"))
+        pk = conn.execute(text(
+            "SELECT name FROM sys.indexes WHERE object_id = OBJECT_ID('editais') AND is_primary_key = 1"
+        )).scalar()
+        conn.execute(text(
+            f"CREATE FULLTEXT INDEX ON editais (titulo, texto_busca) KEY INDEX [{pk}] "
+            "ON edital_ft WITH CHANGE_TRACKING AUTO"
+        ))
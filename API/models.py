@@ -1,11 +1,64 @@
 # API/models.py
 
-from sqlalchemy import Column, Integer, String, Date, Text, DateTime, Boolean
-from sqlalchemy.dialects.mssql import NVARCHAR
+import orjson
+from sqlalchemy import Column, Index, Integer, String, Date, UnicodeText, DateTime, Boolean, LargeBinary
+from sqlalchemy.types import TypeDecorator
+from sqlalchemy.orm import deferred
+from sqlalchemy.dialects.mssql import NVARCHAR, VARBINARY
 from datetime import datetime
 
 from .database import Base
 
+# =========================
+# Tipos
+# =========================
+
+class JSONTexto(TypeDecorator):
+    """
+    JSON armazenado como texto Unicode (NVARCHAR(MAX) no SQL Server).
+    A (de)serialização acontece na fronteira do banco com orjson, então a aplicação
+    já lê/grava dict/list. Conteúdo vazio ou inválido é lido como None.
+    O orjson grava UTF-8 cru (sem escapes ASCII): numa coluna VARCHAR, caracteres fora da
+    code page virariam "?" sem erro, daí o UnicodeText.
+    """
+    impl = UnicodeText
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return orjson.dumps(value).decode()
+
+    def process_result_value(self, value, dialect):
+        if not value:
+            return None
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            return None
+
+    def coerce_compared_value(self, op, value):
+        # Comparações (ex: ILIKE '%termo%' do /chat) usam o texto cru, sem serializar o literal
+        return UnicodeText()
+
+def texto_para_busca(conteudo) -> str:
+    """
+    Achata os valores de texto do json_data (recursivo, sem as chaves e sem a
+    pontuação do JSON) num texto simples para a busca do /chat.
+    """
+    partes = []
+    pilha = [conteudo]
+    while pilha:
+        item = pilha.pop()
+        if isinstance(item, str):
+            if item.strip():
+                partes.append(item.strip())
+        elif isinstance(item, dict):
+            pilha.extend(reversed(list(item.values())))
+        elif isinstance(item, (list, tuple)):
+            pilha.extend(reversed(item))
+    return " ".join(partes)
+
 # =========================
 # Models (Production Ready)
 # =========================
@@ -17,14 +70,25 @@ class Edital(Base):
     titulo = Column(String, index=True)
     
     # JSON armazenado como texto (decisão consciente)
-    json_data = Column(Text)
+    json_data = Column(JSONTexto)
     
     # Lista de arquivos serializada em JSON
-    arquivos_json = Column(Text)
+    arquivos_json = Column(JSONTexto)
     
     data_final_submissao = Column(Date)
     pdf_url = Column(String)
 
+    # Sempre UTC (Naive); usado para o ETag da listagem
+    atualizado_em = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=True)
+
+    # Texto extraído dos PDFs para o chat (cache persistente).
+    # deferred: só é carregado quando acessado, não pesa nas demais consultas.
+    texto_extraido = deferred(Column(UnicodeText, nullable=True))
+
+    # Valores de texto do json_data achatados (ver texto_para_busca): é o que a
+    # busca do /chat consulta, em vez do JSON cru com chaves e pontuação.
+    texto_busca = deferred(Column(UnicodeText, nullable=True))
+
 
 class User(Base):
     __tablename__ = "users"
@@ -67,9 +131,28 @@ class Cliente(Base):
     contato_ok = Column(Boolean, default=False)
     politica_ok = Column(Boolean, default=False)
     
-    # Token de sessão (cookie)
+    # Token de sessão (cookie) — legado: sessões antigas guardavam o token cru
     token = Column(NVARCHAR(255), unique=True, index=True)
     token_expiration = Column(DateTime, nullable=True)
+
+    # SHA-256 do token de sessão (32 bytes). O cookie cru não vai para o banco,
+    # e o índice compara binário de tamanho fixo em vez de NVARCHAR.
+    # Indexado só pelo índice de cobertura declarado abaixo (ix_clientes_token_hash_cover, não unique).
+    token_hash = Column(LargeBinary().with_variant(VARBINARY(32), "mssql"), nullable=True)
     
     # Sempre UTC para consistência (Naive datetime)
     criado_em = Column(DateTime, default=datetime.utcnow)
+
+
+# Índice de cobertura do /cliente/me: a validação da sessão lê tudo do próprio índice,
+# sem bookmark lookup na tabela. É o único índice em token_hash (cada login/logout
+# grava nele). SQLite não tem INCLUDE: lá vira um índice filtrado simples.
+Index(
+    "ix_clientes_token_hash_cover",
+    Cliente.token_hash,
+    mssql_include=["id", "nome", "email_verificado", "token_expiration"],
+    postgresql_include=["id", "nome", "email_verificado", "token_expiration"],
+    mssql_where=Cliente.token_hash.isnot(None),
+    postgresql_where=Cliente.token_hash.isnot(None),
+    sqlite_where=Cliente.token_hash.isnot(None),
+)
@@ -0,0 +1,111 @@
+# API/pdf_service.py
+
+import math
+import re
+from collections import Counter
+from typing import NamedTuple
+
+# =========================
+# Extração de texto (PDF)
+# =========================
+
+# Limite de texto enviado ao modelo por edital
+MAX_TEXTO_EDITAL = 200_000
+
+def extrair_texto_pdf(conteudo: bytes) -> str:
+    """
+    Extrai o texto do PDF (CPU-bound; roda no pool de processos do chat).
+    Fica num módulo leve, sem FastAPI/banco, para ser importado barato pelos workers.
+    O texto é truncado no fim; não adianta extrair páginas que seriam descartadas.
+    """
+    # Import tardio: só os processos do pool de PDF carregam o PyMuPDF
+    import fitz  # PyMuPDF
+
+    partes = []
+    total = 0
+    with fitz.open(stream=conteudo, filetype="pdf") as doc:
+        for page in doc:
+            trecho = page.get_text("text") or ""
+            partes.append(trecho)
+            total += len(trecho)
+            if total >= MAX_TEXTO_EDITAL:
+                break
+    return "".join(partes)
+
+# =========================
+# Seleção de trechos (contexto do chat)
+# =========================
+
+# ~500 tokens por trecho (≈ 4 caracteres/token), com sobreposição para não
+# cortar uma cláusula no meio
+TAMANHO_TRECHO = 2000
+SOBREPOSICAO_TRECHO = 200
+TOP_K_TRECHOS = 8
+
+_PALAVRA_RE = re.compile(r"\w{3,}")
+
+def dividir_em_trechos(texto: str) -> list[str]:
+    """
+    Divide o texto do edital em trechos de tamanho fixo com sobreposição.
+    """
+    passo = TAMANHO_TRECHO - SOBREPOSICAO_TRECHO
+    return [texto[i:i + TAMANHO_TRECHO] for i in range(0, max(len(texto) - SOBREPOSICAO_TRECHO, 1), passo)]
+
+class IndiceTrechos(NamedTuple):
+    """
+    Índice BM25 dos trechos de um edital. Montado uma vez por texto e
+    reaproveitado em todas as perguntas sobre o mesmo edital.
+    """
+    texto: str
+    trechos: list[str]
+    docs: list[Counter]
+    tamanhos: list[int]
+    media: float
+    df: Counter
+
+def indexar_trechos(texto: str) -> IndiceTrechos:
+    """
+    Divide o texto em trechos e pré-calcula frequências de termos (tf/df) e tamanhos.
+    """
+    trechos = dividir_em_trechos(texto)
+    docs = [Counter(_PALAVRA_RE.findall(t.lower())) for t in trechos]
+    tamanhos = [sum(d.values()) for d in docs]
+    media = (sum(tamanhos) / len(docs) if docs else 0.0) or 1.0
+    df: Counter = Counter()
+    for d in docs:
+        df.update(d.keys())
+    return IndiceTrechos(texto, trechos, docs, tamanhos, media, df)
+
+def selecionar_trechos(indice: IndiceTrechos, pergunta: str, k: int = TOP_K_TRECHOS) -> str:
+    """
+    Ranqueia os trechos do edital por BM25 contra a pergunta e devolve os k
+    melhores, na ordem em que aparecem no documento.
+    Sem termos em comum, devolve os k primeiros trechos (início do edital).
+    """
+    trechos = indice.trechos
+    if len(trechos) <= k:
+        return indice.texto
+
+    n = len(trechos)
+    k1, b = 1.5, 0.75
+    idf = {}
+    for termo in set(_PALAVRA_RE.findall(pergunta.lower())):
+        df = indice.df.get(termo, 0)
+        if df:
+            idf[termo] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    if not idf:
+        return "\n".join(trechos[:k])
+
+    pontuacoes = []
+    for i, d in enumerate(indice.docs):
+        norma = k1 * (1 - b + b * indice.tamanhos[i] / indice.media)
+        score = 0.0
+        for termo, peso in idf.items():
+            tf = d.get(termo, 0)
+            if tf:
+                score += peso * tf * (k1 + 1) / (tf + norma)
+        pontuacoes.append((score, i))
+
+    melhores = sorted(i for _, i in sorted(pontuacoes, reverse=True)[:k])
+    return "\n...\n".join(trechos[i] for i in melhores)
@@ -0,0 +1,62 @@
+# API/rate_limit.py
+
+import time
+import threading
+from collections import deque
+from typing import Callable
+
+from cachetools import TTLCache
+from fastapi import HTTPException, Request, status
+
+# =========================
+# Rate Limit (janela deslizante)
+# =========================
+
+# Contadores em memória, por worker: {(nome, ip): deque de timestamps}.
+# O TTLCache descarta IPs inativos; o lock cobre as rotas `def` (threadpool).
+_janelas: TTLCache = TTLCache(maxsize=50000, ttl=3600)
+_lock = threading.Lock()
+
+def ip_cliente(request: Request) -> str:
+    """
+    IP do cliente. Atrás do front-end do Azure App Service o IP real chega no
+    X-Forwarded-For; usamos a última entrada (a adicionada pelo proxy), não a
+    primeira, que o próprio cliente pode forjar.
+    """
+    encaminhado = request.headers.get("x-forwarded-for")
+    if encaminhado:
+        ip = encaminhado.split(",")[-1].strip()
+        # Azure envia "ip:porta" (IPv4) ou "[ip]:porta" (IPv6)
+        if ip.startswith("["):
+            return ip[1:ip.find("]")]
+        if ip.count(":") == 1:
+            return ip.split(":", 1)[0]
+        return ip
+    return request.client.host if request.client else "desconhecido"
+
+def rate_limit(nome: str, max_requisicoes: int, janela: int) -> Callable:
+    """
+    Dependency: no máximo `max_requisicoes` por IP a cada `janela` segundos.
+    Ex: Depends(rate_limit("login", max_requisicoes=5, janela=60))
+    """
+    async def dependencia(request: Request) -> None:
+        chave = (nome, ip_cliente(request))
+        agora = time.monotonic()
+        with _lock:
+            hits = _janelas.get(chave)
+            if hits is None:
+                hits = deque()
+            while hits and hits[0] <= agora - janela:
+                hits.popleft()
+            if len(hits) >= max_requisicoes:
+                retry = int(hits[0] + janela - agora) + 1
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Muitas tentativas. Aguarde e tente novamente.",
+                    headers={"Retry-After": str(retry)}
+                )
+            hits.append(agora)
+            # Reatribui para renovar o TTL da chave
+            _janelas[chave] = hits
+
+    return dependencia
@@ -1,6 +1,8 @@
 from API.database import engine
-from API.models import Base
+from API.migrations import aplicar_migracoes, sanear_json_data
 
-print("Criando tabelas...")
-Base.metadata.create_all(bind=engine)
+# Rodar uma vez por deploy, antes de subir os workers (e então AUTO_MIGRATE=0).
+print("Criando tabelas e aplicando migrações...")
+aplicar_migracoes(engine)
+sanear_json_data(engine)
 print("Tabelas criadas com sucesso 🚀")